@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+import argparse
+from collections import Counter
+
+import numpy as np
+
+# (row, column) steps: horizontal, vertical, diagonal down and up
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+
+def window_sums(cells, n, direction):
+    """
+    Sums of all windows of length n in one direction, (N, rows, cols).
+
+    Built from n shifted views instead of dense templates, so memory is
+    O(N * m * m) for any board size.
+    """
+    dr, dc = direction
+    m = cells.shape[1]
+    rows = m - dr * (n - 1)
+    cols = m - abs(dc) * (n - 1)
+    start_col = n - 1 if dc < 0 else 0
+
+    sums = np.zeros((len(cells), rows, cols), dtype=np.int16)
+    for i in range(n):
+        row, col = dr * i, start_col + dc * i
+        sums += cells[:, row:row + rows, col:col + cols]
+    return sums
+
+
+def analyze_chunk(boards, n):
+    """
+    Analyzes a batch of boards (N, m, m) with 1 (X), -1 (O) and 0.
+
+    Returns a dict with
+        winner      (N,) int8: 1, -1 or 0
+        threats_x   (N,) int32: open windows with n - 1 X disks and no O
+        threats_o   (N,) int32: open windows with n - 1 O disks and no X
+        legal       (N,) bool: reachable by a game where X begins
+    """
+    boards = np.asarray(boards)
+    x = (boards == 1).astype(np.int8)
+    o = (boards == -1).astype(np.int8)
+
+    won_x = np.zeros(len(boards), dtype=bool)
+    won_o = np.zeros(len(boards), dtype=bool)
+    threats_x = np.zeros(len(boards), dtype=np.int32)
+    threats_o = np.zeros(len(boards), dtype=np.int32)
+    for direction in DIRECTIONS:
+        sums_x = window_sums(x, n, direction).reshape(len(boards), -1)
+        sums_o = window_sums(o, n, direction).reshape(len(boards), -1)
+
+        won_x |= np.any(sums_x == n, axis=1)
+        won_o |= np.any(sums_o == n, axis=1)
+        threats_x += np.sum((sums_x == n - 1) & (sums_o == 0), axis=1)
+        threats_o += np.sum((sums_o == n - 1) & (sums_x == 0), axis=1)
+
+    # X begins: X has as many disks as O or one more
+    n_x = np.sum(x, axis=(1, 2))
+    n_o = np.sum(o, axis=(1, 2))
+    difference = n_x - n_o
+
+    # No floating disks: below every disk is a disk (row 0 is the top)
+    supported = np.all(
+        (boards[:, :-1] == 0) | (boards[:, 1:] != 0), axis=(1, 2)
+    )
+
+    # The game stops with the first win, so the winner moved last
+    legal = supported & ((difference == 0) | (difference == 1)) & ~(won_x & won_o)
+    legal &= ~won_x | (difference == 1)
+    legal &= ~won_o | (difference == 0)
+
+    winner = np.zeros(len(boards), dtype=np.int8)
+    winner[won_x & ~won_o] = 1
+    winner[won_o & ~won_x] = -1
+
+    return {
+        'winner': winner,
+        'threats_x': threats_x,
+        'threats_o': threats_o,
+        'legal': legal,
+    }
+
+
+def iter_analysis(boards, n, chunk_size=10000):
+    """
+    Yields (start, result) per chunk. Only one chunk of boards is in
+    memory at a time, so `boards` can be a memory-mapped file.
+    """
+    for start in range(0, len(boards), chunk_size):
+        yield start, analyze_chunk(boards[start:start + chunk_size], n)
+
+
+def analyze_boards(boards, n, chunk_size=10000):
+    """
+    Analyzes a batch of boards (N, m, m) chunk by chunk, see analyze_chunk.
+    """
+    results = {
+        'winner': np.zeros(len(boards), dtype=np.int8),
+        'threats_x': np.zeros(len(boards), dtype=np.int32),
+        'threats_o': np.zeros(len(boards), dtype=np.int32),
+        'legal': np.zeros(len(boards), dtype=bool),
+    }
+    for start, result in iter_analysis(boards, n, chunk_size):
+        for key, values in result.items():
+            results[key][start:start + len(values)] = values
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Analyze boards stored as .npy array (N, m, m).'
+    )
+    parser.add_argument(
+        'boards',
+        help='Path of the .npy file (read memory-mapped).',
+        type=str
+    )
+    parser.add_argument(
+        '-n',
+        help='Required disks to win.',
+        default=4,
+        type=int
+    )
+    parser.add_argument(
+        '--chunk-size',
+        help='Boards processed at once.',
+        default=10000,
+        type=int
+    )
+    args = parser.parse_args()
+
+    boards = np.load(args.boards, mmap_mode='r')
+
+    winners = Counter()
+    illegal = 0
+    threats = np.zeros(2, dtype=np.int64)
+    for _, result in iter_analysis(boards, args.n, args.chunk_size):
+        winners.update(result['winner'].tolist())
+        illegal += int(np.sum(~result['legal']))
+        threats += [np.sum(result['threats_x']), np.sum(result['threats_o'])]
+
+    print(f'Boards: {len(boards)} | Illegal: {illegal}')
+    print(f'Winners: {winners}')
+    print(f'Open threats: X {threats[0]}, O {threats[1]}')
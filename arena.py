@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+import argparse
+import functools
+import itertools as it
+import math
+import multiprocessing as mp
+
+import numpy as np
+
+from search import SharedTranspositionTable
+from solver import winning_lines, winning_templates
+
+
+def policy_factory(policy):
+    # Factory of players without state
+    return policy
+
+
+def random_player(board, disk):
+    return int(np.random.choice(np.flatnonzero(board[0] == 0)))
+
+
+def stack_on_top_player(board, disk):
+    # Same as ConnectN.stack_on_top: first non empty, playable column
+    # from the bottom row up
+    m = len(board)
+    for row in range(m - 1, -1, -1):
+        for i, col in enumerate(board[row]):
+            if col != 0 and board[0, i] == 0:
+                return i
+
+    # Otherwise, apply random turn
+    return random_player(board, disk)
+
+
+def heuristic_player(n, m):
+    from heuristic import HeuristicPlayer
+
+    return HeuristicPlayer(winning_templates(n, m), n)
+
+
+def search_player(n, m, table=None, max_depth=4, time_limit=0.1):
+    from search import SearchPlayer
+
+    return SearchPlayer(
+        winning_templates(n, m), n, max_depth=max_depth,
+        time_limit=time_limit, table=table
+    )
+
+
+def dqn_player(n, m, model_path):
+    from learner import DQNAgent
+
+    agent = DQNAgent(list(range(m)), f'Connect{n}', m, m)
+    agent.load_model(model_path)
+
+    def policy(board, disk):
+        # The agent learned to play with its own disks as 1
+        action = agent.select_action(board * disk, 0.)
+        if board[0, action] != 0:
+            return random_player(board, disk)
+        return action
+
+    return policy
+
+
+def lines_per_cell(lines, m):
+    return [lines[np.any(lines == cell, axis=1)] for cell in range(m * m)]
+
+
+def play_game(player_x, player_o, n, m, cell_lines):
+    """
+    Plays one game, X (1) begins. Returns the winner (1, -1) or 0.
+    """
+    board = np.zeros((m, m))
+    players = it.cycle([(1, player_x), (-1, player_o)])
+
+    for _ in range(m * m):
+        disk, player = next(players)
+        column = player(board, disk)
+        row = m - int(np.sum(board[:, column] != 0)) - 1
+        board[row, column] = disk
+
+        # Only lines through the new disk can be complete
+        flat = board.reshape(-1)
+        if np.any(np.sum(flat[cell_lines[row * m + column]], axis=1) == n * disk):
+            return disk
+    return 0
+
+
+# Players are built once per worker process
+_PLAYERS = {}
+
+
+def _get_player(name, factory):
+    if name not in _PLAYERS:
+        _PLAYERS[name] = factory()
+    return _PLAYERS[name]
+
+
+# Counters of SharedTranspositionTable.stats, summed over the workers
+TABLE_COUNTERS = ['probes', 'hits', 'stores', 'collisions']
+
+
+def _table_counters(players):
+    # Shared tables of the players (each counted once)
+    tables = {}
+    for player in players:
+        table = getattr(player, 'table', None)
+        if isinstance(table, SharedTranspositionTable):
+            tables[id(table)] = table
+    return {
+        key: sum(table.stats()[key] for table in tables.values())
+        for key in TABLE_COUNTERS
+    }
+
+
+def _play_games(task):
+    (name_a, factory_a), (name_b, factory_b), n, m, first_game, n_games, seed = task
+    np.random.seed(seed)
+
+    player_a = _get_player(name_a, factory_a)
+    player_b = _get_player(name_b, factory_b)
+    cell_lines = lines_per_cell(winning_lines(n, m), m)
+    counters = _table_counters([player_a, player_b])
+
+    # Scores from the point of view of player a
+    scores = []
+    for game in range(first_game, first_game + n_games):
+        # Alternate who moves first
+        if game % 2 == 0:
+            scores.append((play_game(player_a, player_b, n, m, cell_lines) + 1) / 2)
+        else:
+            scores.append((1 - play_game(player_b, player_a, n, m, cell_lines)) / 2)
+
+    # Table statistics of this task only (the worker counters accumulate)
+    counters = {
+        key: value - counters[key]
+        for key, value in _table_counters([player_a, player_b]).items()
+    }
+    return scores, counters
+
+
+def elo_to_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprt_llr(scores, elo0, elo1):
+    """
+    Log likelihood ratio of H1 (elo difference elo1) against H0 (elo0),
+    using the normal approximation of the (win, draw, loss) results.
+    """
+    scores = np.asarray(scores)
+    if len(scores) < 2:
+        return 0.
+    s0, s1 = elo_to_score(elo0), elo_to_score(elo1)
+    var = np.var(scores)
+    if var == 0:
+        # All results equal (e.g. only wins): no variance can be estimated,
+        # use the one of win/loss games at the score between H0 and H1
+        s = (s0 + s1) / 2
+        var = s * (1 - s)
+    return (s1 - s0) * (2 * np.sum(scores) - (s0 + s1) * len(scores)) / (2 * var)
+
+
+class Arena():
+    """
+    Round robin tournament between registered players.
+
+    A player is a callable (board, disk) -> column. Players are registered
+    as picklable factories (top level functions or functools.partial), so
+    every worker process can build its own instance (e.g. a DQNAgent).
+    Players without state are wrapped with `policy_factory`.
+
+    Every pairing is played in batches of games in parallel, alternating
+    who moves first. After each batch a sequential probability ratio test
+    checks, whether one player is stronger by `elo_margin`; the pairing
+    stops as soon as this is decided or after `max_games`.
+    """
+
+    def __init__(self, n=4, m=7, processes=None, batch_size=50,
+                 max_games=1000, elo_margin=50., alpha=0.05, beta=0.05,
+                 k_factor=16., initial_elo=1500.):
+        self.n = n  # Required disks to win
+        self.m = m  # Size of field
+        self.processes = processes or mp.cpu_count()
+        self.batch_size = batch_size
+        self.max_games = max_games
+        self.elo_margin = elo_margin
+        self.k_factor = k_factor
+        self.initial_elo = initial_elo
+
+        # SPRT bounds
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+
+        self.players = {}
+        self.elo = {}
+        self.results = {}
+        self.table_stats = dict.fromkeys(TABLE_COUNTERS, 0)
+
+    def register(self, name, factory):
+        self.players[name] = factory
+        self.elo[name] = self.initial_elo
+        self.results[name] = {'win': 0, 'draw': 0, 'loss': 0}
+
+    def _update(self, name_a, name_b, scores):
+        for score in scores:
+            expected = elo_to_score(self.elo[name_a] - self.elo[name_b])
+            self.elo[name_a] += self.k_factor * (score - expected)
+            self.elo[name_b] -= self.k_factor * (score - expected)
+
+            outcome = {1.: ('win', 'loss'), .5: ('draw', 'draw'),
+                       0.: ('loss', 'win')}[score]
+            self.results[name_a][outcome[0]] += 1
+            self.results[name_b][outcome[1]] += 1
+
+    def play_pairing(self, name_a, name_b, pool):
+        scores = []
+        llr = 0.
+        while len(scores) < self.max_games:
+            # One task per process, each with its own seed
+            n_games = min(self.batch_size, self.max_games - len(scores))
+            tasks = []
+            per_task = max(1, n_games // self.processes)
+            for first_game in range(len(scores), len(scores) + n_games, per_task):
+                tasks.append((
+                    (name_a, self.players[name_a]),
+                    (name_b, self.players[name_b]),
+                    self.n, self.m, first_game,
+                    min(per_task, len(scores) + n_games - first_game),
+                    np.random.randint(2 ** 31),
+                ))
+            batch = []
+            for scores_task, counters in pool.map(_play_games, tasks):
+                batch += scores_task
+                for key, value in counters.items():
+                    self.table_stats[key] += value
+
+            scores += batch
+            self._update(name_a, name_b, batch)
+
+            llr = sprt_llr(scores, -self.elo_margin, self.elo_margin)
+            if not self.lower_bound < llr < self.upper_bound:
+                break
+
+        return {
+            'games': len(scores),
+            'score': float(np.mean(scores)),
+            'llr': llr,
+            'decided': not self.lower_bound < llr < self.upper_bound,
+        }
+
+    def run(self):
+        pairings = {}
+        with mp.Pool(self.processes) as pool:
+            for name_a, name_b in it.combinations(self.players, 2):
+                pairings[(name_a, name_b)] = self.play_pairing(
+                    name_a, name_b, pool
+                )
+        return pairings
+
+    def report(self, pairings):
+        for (name_a, name_b), result in pairings.items():
+            print(
+                '{} vs {}: SCORE: {score:.3f} | GAMES: {games:04d} | '
+                'LLR: {llr:+.2f} | DECIDED: {decided}'.format(
+                    name_a, name_b, **result
+                )
+            )
+        for name in sorted(self.elo, key=self.elo.get, reverse=True):
+            print(
+                '{:<16} ELO: {:7.1f} | W/D/L: {win}/{draw}/{loss}'.format(
+                    name, self.elo[name], **self.results[name]
+                )
+            )
+        if self.table_stats['probes']:
+            # Summed over all workers
+            print(
+                'Shared table: PROBES: {probes} | HIT RATE: {hit_rate:.3f} | '
+                'STORES: {stores} | COLLISIONS: {collisions}'.format(
+                    hit_rate=self.table_stats['hits'] / self.table_stats['probes'],
+                    **self.table_stats
+                )
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Round robin tournament between Connect N players.'
+    )
+    parser.add_argument(
+        '-n',
+        help='Required disks to win.',
+        default=4,
+        type=int
+    )
+    parser.add_argument(
+        '-m',
+        help='Dimensions of the board.',
+        default=7,
+        type=int
+    )
+    parser.add_argument(
+        '--max-games',
+        help='Maximal number of games per pairing.',
+        default=1000,
+        type=int
+    )
+    parser.add_argument(
+        '--processes',
+        help='Number of worker processes.',
+        default=None,
+        type=int
+    )
+    parser.add_argument(
+        '--checkpoint',
+        help='DQNAgent checkpoints to add as players.',
+        default=[],
+        nargs='*',
+        type=str
+    )
+    args = parser.parse_args()
+
+    arena = Arena(
+        args.n, args.m, processes=args.processes, max_games=args.max_games
+    )
+    arena.register('random', functools.partial(policy_factory, random_player))
+    arena.register(
+        'stack_on_top', functools.partial(policy_factory, stack_on_top_player)
+    )
+    arena.register(
+        'heuristic', functools.partial(heuristic_player, args.n, args.m)
+    )
+    # All workers share one transposition table
+    table = SharedTranspositionTable(2 ** 20)
+    arena.register(
+        'search', functools.partial(search_player, args.n, args.m, table)
+    )
+    for checkpoint in args.checkpoint:
+        arena.register(
+            checkpoint, functools.partial(dqn_player, args.n, args.m, checkpoint)
+        )
+
+    try:
+        arena.report(arena.run())
+        print(f'Shared table occupancy: {table.stats()["occupancy"]:.3f}')
+    finally:
+        table.close()
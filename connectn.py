@@ -2,7 +2,9 @@
 import argparse
 import numpy as np
 import itertools as it
-import os
+
+from renderer import TerminalRenderer
+from search import SearchPlayer
 
 # For statistics
 try:
@@ -34,6 +36,25 @@ parser.add_argument(
     type=str,
     choices=['2h', '1h1c', '2c']
 )
+parser.add_argument(
+    '--cpu',
+    help='CPU player.',
+    default='random',
+    type=str,
+    choices=['random', 'search']
+)
+parser.add_argument(
+    '--think-time',
+    help='Seconds per move of the search CPU player.',
+    default=1.,
+    type=float
+)
+parser.add_argument(
+    '--depth',
+    help='Maximal search depth of the search CPU player.',
+    default=6,
+    type=int
+)
 args = parser.parse_args()
 
 
@@ -45,12 +66,23 @@ class ConnectN():
         0.: ' '
     }
 
-    def __init__(self, n, m, mode):
+    def __init__(self, n, m, mode, cpu='random', think_time=1., depth=6,
+                 table=None):
         self.n = n  # Size of field
         self.m = m  # Required disks to win
         self.mode = mode  # Game mode
         self.create_winning_templates()
 
+        # Search player thinks during the human's turn as well. The table
+        # may be a SharedTranspositionTable used by several processes.
+        self.cpu_player = None
+        if cpu == 'search':
+            self.cpu_player = SearchPlayer(
+                self.winning_templates, self.n, max_depth=depth,
+                time_limit=think_time, table=table
+            )
+        self.renderer = TerminalRenderer(self.m, self.VISUALISATION)
+
         self.refresh_game()
 
     def refresh_game(self):
@@ -63,6 +95,12 @@ class ConnectN():
         self.disks_set = 0
         self.game_over = False
 
+        # Lines still winnable per player (no opponent disk in them)
+        self.open_lines = {
+            1: np.ones(len(self.winning_templates), dtype=bool),
+            -1: np.ones(len(self.winning_templates), dtype=bool),
+        }
+
         self.winner = None
 
     def toggle_disk(self):
@@ -98,6 +136,19 @@ class ConnectN():
                     winning_templates.append(board_diag_up)
 
         self.winning_templates = np.array(winning_templates)
+        # Lines through each cell: (cells, lines)
+        self.cell_lines = self.winning_templates.reshape(
+            len(self.winning_templates), -1
+        ).T.astype(bool)
+
+    def close_lines(self, row, column):
+        # A disk blocks all lines through its cell for the opponent
+        self.open_lines[-self.current_disk] &= \
+            ~self.cell_lines[row * self.m + column]
+
+    def is_dead_draw(self):
+        # No line can be completed by any player anymore
+        return not np.any(self.open_lines[1] | self.open_lines[-1])
 
     def check_for_winning(self):
         if np.max(
@@ -111,12 +162,8 @@ class ConnectN():
             return True
         return False
 
-    def display_board(self):
-        for row in self.board:
-            text = '|' + ''.join([self.VISUALISATION[val] for val in row]) + '|'
-            print(text)
-        # Make it more human readable
-        print(f' {"".join([str(i) for i in range(self.m)])} ')
+    def display_board(self, message=None):
+        self.renderer.draw(self.board, message)
 
     def set_disk(self, column):
         # Check for valid turn
@@ -129,8 +176,9 @@ class ConnectN():
 
         # Place disk
         disks_in_column = np.sum(np.abs(self.board[:, column]))
-        self.board[int(self.m - disks_in_column - 1), column] = \
-            self.current_disk
+        row = int(self.m - disks_in_column - 1)
+        self.board[row, column] = self.current_disk
+        self.close_lines(row, column)
 
         # Adjust turn options, of column is full
         if disks_in_column + 1 == self.m:
@@ -155,10 +203,16 @@ class ConnectN():
 
     def cpu_turn(self):
         # TODO: Machine learning
+        if self.cpu_player is not None:
+            self.set_disk(
+                self.cpu_player.select_action(self.board, self.current_disk)
+            )
+            return
         self.set_disk(np.random.choice(list(self.possible_turns)))
 
     def refresh_screen(self):
-        os.system('clear')
+        # Next display redraws the whole screen
+        self.renderer.reset()
 
     def play(self):
         # TODO: Tidy up game modes
@@ -169,15 +223,20 @@ class ConnectN():
             ### Play against CPU
             if self.mode == '1h1c':
                 if self.current_disk == 1:
+                    # Ponder while waiting for the human
+                    if self.cpu_player is not None:
+                        self.cpu_player.start_pondering(
+                            self.board, self.current_disk
+                        )
                     self.human_turn()
-                    self.refresh_screen()
+                    if self.cpu_player is not None:
+                        self.cpu_player.stop_pondering()
                 else:
                     self.cpu_turn()
-                    self.display_board()
+                self.display_board()
             ### Play human vs human
             elif self.mode == '2h':
                 self.human_turn()
-                self.refresh_screen()
                 self.display_board()
             ### Play CPU vs CPU
             else:
@@ -189,19 +248,15 @@ class ConnectN():
                 self.game_over = True
                 self.winner = self.current_disk
                 if 'h' in self.mode:
-                    self.refresh_screen()
-                    self.display_board()
-                    print(
+                    self.display_board(
                         f'Winner: {self.VISUALISATION[self.current_disk]}'
                     )
 
-            elif self.disks_set >= self.m * self.m:
+            elif self.disks_set >= self.m * self.m or self.is_dead_draw():
                 self.game_over = True
                 self.winner = 0
                 if 'h' in self.mode:
-                    self.refresh_screen()
-                    self.display_board()
-                    print(f'No Winner.')
+                    self.display_board('No Winner.')
 
             self.toggle_disk()
 
@@ -216,7 +271,9 @@ if __name__=='__main__':
             f'n should be greater than 1. ({args.n})'
         )
 
-    connectn = ConnectN(args.n, args.m, args.mode)
+    connectn = ConnectN(
+        args.n, args.m, args.mode, args.cpu, args.think_time, args.depth
+    )
 
     if 'h' in args.mode:
         connectn.play()
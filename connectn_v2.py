@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 import numpy as np
 import itertools as it
-import os
+
+from heuristic import HeuristicPlayer
+from renderer import TerminalRenderer
+from search import SearchPlayer
 
 
 class ConnectN():
@@ -12,13 +15,25 @@ class ConnectN():
         0.: ' '
     }
 
-    def __init__(self, n, m, mode):
+    def __init__(self, n, m, mode, opponent='stack_on_top', table=None):
+        assert opponent in ['stack_on_top', 'heuristic', 'search']
+
         self.name = f'Connect{n}'
         self.n = n  # Required disks to win
         self.m = m  # Size of field
         self.mode = mode  # Game mode
+        self.opponent = opponent  # Second player in update()
         self.enable_actions = list(range(m))
         self.create_winning_templates()
+        self.heuristic_player = HeuristicPlayer(self.winning_templates, self.n)
+        # The table may be a SharedTranspositionTable of several processes
+        self.search_player = None
+        if opponent == 'search':
+            self.search_player = SearchPlayer(
+                self.winning_templates, self.n, max_depth=4, time_limit=0.1,
+                table=table
+            )
+        self.renderer = TerminalRenderer(self.m, self.VISUALISATION)
 
         self.reset()
 
@@ -32,6 +47,12 @@ class ConnectN():
         self.disks_set = 0
         self.game_over = False
 
+        # Lines still winnable per player (no opponent disk in them)
+        self.open_lines = {
+            1: np.ones(len(self.winning_templates), dtype=bool),
+            -1: np.ones(len(self.winning_templates), dtype=bool),
+        }
+
         self.winner = None
 
         self.reward = 0
@@ -53,8 +74,9 @@ class ConnectN():
 
         # Place disk
         disks_in_column = np.sum(np.abs(self.board[:, action]))
-        self.board[int(self.m - disks_in_column - 1), action] = \
-            self.current_disk
+        row = int(self.m - disks_in_column - 1)
+        self.board[row, action] = self.current_disk
+        self.close_lines(row, action)
 
         # Adjust turn options, of column is full
         if disks_in_column + 1 == self.m:
@@ -66,15 +88,21 @@ class ConnectN():
             self.terminal = True
             return
 
-        # Board is full --> no winner
-        elif self.disks_set >= self.m * self.m:
+        # Board is full or no line is winnable --> no winner
+        elif self.disks_set >= self.m * self.m or self.is_dead_draw():
             self.reward = 0
             self.game_over = True
+            self.terminal = True
             return
 
-        # Second player: 25% Random turn, 75% Stack on top.
+        # Second player: Greedy threat heuristic, alpha-beta search, or
+        # 25% Random turn, 75% Stack on top.
         self.toggle_disk()
-        if np.random.random() > 0.75:
+        if self.opponent == 'heuristic':
+            self.heuristic_turn()
+        elif self.opponent == 'search':
+            self.search_turn()
+        elif np.random.random() > 0.75:
             self.random_turn()
         else:
             self.stack_on_top()
@@ -86,10 +114,11 @@ class ConnectN():
             self.terminal = True
             return
 
-        # Again: Check if board is full
-        elif self.disks_set >= self.m * self.m:
+        # Again: Check if board is full or dead
+        elif self.disks_set >= self.m * self.m or self.is_dead_draw():
             self.reward = 0
             self.game_over = True
+            self.terminal = True
             return
 
         # Continue playing
@@ -129,6 +158,19 @@ class ConnectN():
                     winning_templates.append(board_diag_up)
 
         self.winning_templates = np.array(winning_templates)
+        # Lines through each cell: (cells, lines)
+        self.cell_lines = self.winning_templates.reshape(
+            len(self.winning_templates), -1
+        ).T.astype(bool)
+
+    def close_lines(self, row, column):
+        # A disk blocks all lines through its cell for the opponent
+        self.open_lines[-self.current_disk] &= \
+            ~self.cell_lines[row * self.m + column]
+
+    def is_dead_draw(self):
+        # No line can be completed by any player anymore
+        return not np.any(self.open_lines[1] | self.open_lines[-1])
 
     def check_for_winning(self):
         if np.max(
@@ -142,12 +184,8 @@ class ConnectN():
             return True
         return False
 
-    def display_board(self):
-        for row in self.board:
-            text = '|' + ''.join([self.VISUALISATION[val] for val in row]) + '|'
-            print(text)
-        # Make it more human readable
-        print(f' {"".join([str(i) for i in range(self.m)])} ')
+    def display_board(self, message=None):
+        self.renderer.draw(self.board, message)
 
     def set_disk(self, column):
         # Check for valid turn
@@ -160,8 +198,9 @@ class ConnectN():
 
         # Place disk
         disks_in_column = np.sum(np.abs(self.board[:, column]))
-        self.board[int(self.m - disks_in_column - 1), column] = \
-            self.current_disk
+        row = int(self.m - disks_in_column - 1)
+        self.board[row, column] = self.current_disk
+        self.close_lines(row, column)
 
         # Adjust turn options, of column is full
         if disks_in_column + 1 == self.m:
@@ -200,8 +239,19 @@ class ConnectN():
         # Otherwise, apply random turn
         self.random_turn()
 
+    def heuristic_turn(self):
+        self.set_disk(
+            self.heuristic_player.select_action(self.board, self.current_disk)
+        )
+
+    def search_turn(self):
+        self.set_disk(
+            self.search_player.select_action(self.board, self.current_disk)
+        )
+
     def refresh_screen(self):
-        os.system('clear')
+        # Next display redraws the whole screen
+        self.renderer.reset()
 
     def play(self):
         # TODO: Tidy up game modes
@@ -213,14 +263,12 @@ class ConnectN():
             if self.mode == '1h1c':
                 if self.current_disk == 1:
                     self.human_turn()
-                    self.refresh_screen()
                 else:
                     self.cpu_turn()
-                    self.display_board()
+                self.display_board()
             ### Play human vs human
             elif self.mode == '2h':
                 self.human_turn()
-                self.refresh_screen()
                 self.display_board()
             ### Play CPU vs CPU
             else:
@@ -232,18 +280,14 @@ class ConnectN():
                 self.game_over = True
                 self.winner = self.current_disk
                 if 'h' in self.mode:
-                    self.refresh_screen()
-                    self.display_board()
-                    print(
+                    self.display_board(
                         f'Winner: {self.VISUALISATION[self.current_disk]}'
                     )
 
-            elif self.disks_set >= self.m * self.m:
+            elif self.disks_set >= self.m * self.m or self.is_dead_draw():
                 self.game_over = True
                 self.winner = 0
                 if 'h' in self.mode:
-                    self.refresh_screen()
-                    self.display_board()
-                    print(f'No Winner.')
+                    self.display_board('No Winner.')
 
             self.toggle_disk()
@@ -5,6 +5,9 @@ import itertools as it
 import os
 import copy
 
+from heuristic import HeuristicPlayer
+from renderer import TerminalRenderer
+
 import gym
 from gym import spaces
 
@@ -30,7 +33,7 @@ class ConnectNEnv(gym.Env):
         assert len(game_mode) == 2
         # Only specific game modes are allowed
         for gm in game_mode:
-            assert gm in ['learner', 'random', 'human', 'agent']
+            assert gm in ['learner', 'random', 'human', 'agent', 'heuristic']
 
         self.game_mode = game_mode
         
@@ -59,6 +62,8 @@ class ConnectNEnv(gym.Env):
         self.reward_draw = 0
 
         self.create_winning_templates()
+        self.heuristic_player = HeuristicPlayer(self.winning_templates, self.n)
+        self.renderer = TerminalRenderer(self.m, self.VISUALISATION)
         self.reset()
 
     def _step_learner(self, action):
@@ -77,12 +82,9 @@ class ConnectNEnv(gym.Env):
         elif self.disks_set >= self.m * self.m:
             return self.board, self.reward_draw, True, {}
 
-        # Game goes on, toggle the disk
+        # Game goes on, toggle the disk. The opponent moves next.
         self.toggle_disk()
 
-        # Default return
-        return self.board, 0, False, {}
-
     def _step_agent(self):
         # Evaluate action from agent
         self.agent.training = False
@@ -94,14 +96,23 @@ class ConnectNEnv(gym.Env):
             action = self._get_random_action()
 
         # Place disk and evaluate
-        self._evaluate_opponent_turn(action)
+        return self._evaluate_opponent_turn(action)
 
     def _step_random(self):
         # Choose random (possible) action
         action = self._get_random_action()
 
         # Place disk and evaluate
-        self._evaluate_opponent_turn(action)
+        return self._evaluate_opponent_turn(action)
+
+    def _step_heuristic(self):
+        # Greedy turn based on open windows
+        action = self.heuristic_player.select_action(
+            self.board, self.current_disk
+        )
+
+        # Place disk and evaluate
+        return self._evaluate_opponent_turn(action)
 
     def _step_human(self, action):
         # TODO: Write human interface here
@@ -139,14 +150,22 @@ class ConnectNEnv(gym.Env):
         self.disks_set += 1
 
     def step(self, action):
+        # Learner's turn ends the game, or the opponent answers
         result = self._step_learner(action)
         if result is not None:
             return result
 
-        if 'random' in game_mode:
-            result = self._step_random()
-            if result is not None:
-                return result
+        if 'random' in self.game_mode:
+            return self._step_random()
+
+        elif 'heuristic' in self.game_mode:
+            return self._step_heuristic()
+
+        elif 'agent' in self.game_mode:
+            return self._step_agent()
+
+        # No opponent: the learner plays both disks
+        return self.board, 0, False, {}
 
 
     
@@ -202,6 +221,9 @@ class ConnectNEnv(gym.Env):
         self.reward = 0
         self.terminal = False
 
+        # New episode, render it from scratch
+        self.renderer.reset()
+
         return self.board
 
     def seed(self, seed):
@@ -280,15 +302,11 @@ class ConnectNEnv(gym.Env):
 
         return True
     
-    def display_board(self):
-        for row in self.board:
-            text = '|' + ''.join([self.VISUALISATION[val] for val in row]) + '|'
-            print(text)
-        # Make it more human readable
-        print(f' {"".join([str(i) for i in range(self.m)])} ')
+    def display_board(self, message=None):
+        self.renderer.draw(self.board, message)
 
     def _get_random_action(self):
-        self.set_disk(np.random.choice(list(self.possible_turns)))
+        return np.random.choice(list(self.possible_turns))
         
     def render(self, mode='human', close=False):
         self.display_board()
@@ -304,4 +322,4 @@ class ConnectNEnv(gym.Env):
                     return
 
         # Otherwise, apply random turn
-        self._get_random_action()
\ No newline at end of file
+        self.set_disk(self._get_random_action())
\ No newline at end of file
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+import numpy as np
+
+
+class ThreatEvaluator():
+    """
+    Scores boards by counting open windows.
+
+    A window is one of the winning lines from `create_winning_templates`.
+    It is open for a player, if it contains no opponent disks. An open
+    window with k own disks contributes weights[k] to the score of the
+    player and an open window of the opponent subtracts the same amount.
+
+    All methods work on batches of boards (B, m, m), so the evaluator can
+    score all candidate columns at once or serve as leaf evaluation of a
+    depth-limited search.
+    """
+
+    def __init__(self, winning_templates, n, weights=None):
+        self.n = n
+        self.m = winning_templates.shape[-1]
+
+        # Lines as (cells, windows) matrix, so counting is one matmul
+        self.templates = winning_templates.reshape(
+            len(winning_templates), -1
+        ).T.astype(np.int32)
+
+        if weights is None:
+            # Empty windows do not count, a complete window decides the game
+            weights = [0.] + [10. ** (k - 1) for k in range(1, n)] + [1e9]
+        self.weights = np.asarray(weights, dtype=np.float64)
+        assert len(self.weights) == n + 1
+
+    def count_windows(self, boards, disk):
+        """
+        Returns (B, n + 1) counts of open windows with k disks of `disk`.
+        """
+        boards = np.asarray(boards).reshape(-1, self.m * self.m)
+        own = (boards == disk).astype(np.int32) @ self.templates
+        opponent = (boards == -disk).astype(np.int32) @ self.templates
+
+        # Only windows without opponent disks are still open
+        own = np.where(opponent == 0, own, -1)
+
+        counts = np.zeros((len(boards), self.n + 1), dtype=np.int64)
+        for k in range(self.n + 1):
+            counts[:, k] = np.sum(own == k, axis=1)
+        return counts
+
+    def evaluate(self, boards, disk):
+        """
+        Returns (B,) scores of the boards from the point of view of `disk`.
+        """
+        return (
+            self.count_windows(boards, disk) @ self.weights
+            - self.count_windows(boards, -disk) @ self.weights
+        )
+
+    def candidate_boards(self, board, disk):
+        """
+        Returns the playable columns and the boards after playing each.
+        """
+        heights = np.sum(board != 0, axis=0)
+        columns = np.flatnonzero(heights < self.m)
+
+        boards = np.repeat(board[np.newaxis], len(columns), axis=0)
+        boards[np.arange(len(columns)), self.m - heights[columns] - 1,
+               columns] = disk
+        return columns, boards
+
+    def score_columns(self, board, disk):
+        columns, boards = self.candidate_boards(board, disk)
+        return columns, self.evaluate(boards, disk)
+
+
+class HeuristicPlayer():
+    """
+    Greedy (one-ply) player: plays the column with the best evaluation.
+    Ties are broken randomly.
+    """
+
+    def __init__(self, winning_templates, n, weights=None):
+        self.evaluator = ThreatEvaluator(winning_templates, n, weights)
+
+    def select_action(self, board, disk):
+        columns, scores = self.evaluator.score_columns(board, disk)
+        best = columns[scores == np.max(scores)]
+        return int(np.random.choice(best))
+
+    def __call__(self, board, disk):
+        return self.select_action(board, disk)
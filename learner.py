@@ -1,39 +1,95 @@
 from collections import deque
+import glob
 import os
+import queue
+import threading
+import time
 
 import numpy as np
 import tensorflow as tf
 
+from replay import DedupReplayBuffer, MemmapReplayBuffer
+
 
 class DQNAgent:
     """
     Multi Layer Perceptron with Experience Replay
     """
 
-    def __init__(self, enable_actions, environment_name, x_shape=8, y_shape=8):
+    def __init__(self, enable_actions, environment_name, x_shape=8, y_shape=8,
+                 checkpoint_every_updates=None, checkpoint_every_seconds=None,
+                 checkpoint_keep=3, checkpoint_replay=False,
+                 replay_memory_size=1000, replay_dir=None,
+                 target_update_every=100, replay_dedup=False):
+        assert checkpoint_keep >= 1, "Keep at least one checkpoint."
+
         # parameters
         self.name = os.path.splitext(os.path.basename(__file__))[0]
         self.environment_name = environment_name
         self.enable_actions = enable_actions
         self.n_actions = len(self.enable_actions)
         self.minibatch_size = 32
-        self.replay_memory_size = 1000
+        self.replay_memory_size = replay_memory_size
         self.learning_rate = 0.001
         self.discount_factor = 0.9
         self.exploration = 0.1
+        self.target_update_every = target_update_every
         self.model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
         self.model_name = "{}.ckpt".format(self.environment_name)
 
-        # replay memory
-        self.D = deque(maxlen=self.replay_memory_size)
+        # replay memory (in RAM, deduplicated in RAM, or memory-mapped files in replay_dir)
+        if replay_dir:
+            self.D = MemmapReplayBuffer(replay_dir, self.replay_memory_size, (x_shape, y_shape))
+        elif replay_dedup:
+            self.D = DedupReplayBuffer(self.replay_memory_size, self.n_actions)
+        else:
+            self.D = deque(maxlen=self.replay_memory_size)
+
+        # max_action' Q_target(state', action') per replay slot and the id of
+        # the transition it belongs to, valid until the next target sync
+        # (dedup: one slot per orientation, transitions are replayed mirrored)
+        n_cached = self.replay_memory_size
+        if isinstance(self.D, DedupReplayBuffer):
+            n_cached *= 2
+        self.next_value_valid = np.zeros(n_cached, dtype=bool)
+        self.next_value_ids = np.zeros(n_cached, dtype=np.int64)
+        self.next_values = np.zeros(n_cached, dtype=np.float32)
 
         # model
         self.init_model(x_shape, y_shape)
 
         # variables
         self.current_loss = 0.0
+        self.n_updates = 0
+        # a reopened memmap buffer already holds experiences
+        self.n_experiences = len(self.D)
+
+        # background checkpointing
+        self.checkpoint_every_updates = checkpoint_every_updates
+        self.checkpoint_every_seconds = checkpoint_every_seconds
+        self.checkpoint_keep = checkpoint_keep
+        self.checkpoint_replay = checkpoint_replay
+        self.last_checkpoint_update = 0
+        self.last_checkpoint_time = time.time()
+        self.checkpoint_queue = queue.Queue(maxsize=1)
+        self.checkpoint_thread = None
+        self.checkpoint_error = None
+
+        # UpdateScheduler of the training loop, its counters are checkpointed
+        self.scheduler = None
 
     def init_model(self, x_shape, y_shape):
+        # own graph and session, so several agents fit into one process
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.build_model(x_shape, y_shape)
+
+        # session
+        self.sess = tf.Session(graph=self.graph)
+        self.sess.run(self.init_op)
+        self.sync_target()
+
+    def build_model(self, x_shape, y_shape):
         # input layer (8 x 8) / (x_shape x y_shape)
         self.x = tf.placeholder(tf.float32, [None, x_shape, y_shape])
 
@@ -41,15 +97,14 @@ class DQNAgent:
         # flatten (64) / (x_shape x y_shape)
         x_flat = tf.reshape(self.x, [-1, xy])
 
-        # fully connected layer (32) ??
-        W_fc1 = tf.Variable(tf.truncated_normal([xy, xy], stddev=0.01))
-        b_fc1 = tf.Variable(tf.zeros([xy]))
-        h_fc1 = tf.nn.relu(tf.matmul(x_flat, W_fc1) + b_fc1)
+        # online network
+        self.y, online_variables = self.build_network(x_flat, xy)
 
-        # output layer (n_actions)
-        W_out = tf.Variable(tf.truncated_normal([xy, self.n_actions], stddev=0.01))
-        b_out = tf.Variable(tf.zeros([self.n_actions]))
-        self.y = tf.matmul(h_fc1, W_out) + b_out
+        # target network (frozen copy of the online network)
+        self.y_target, target_variables = self.build_network(x_flat, xy, trainable=False)
+        self.sync_target_op = [
+            target.assign(online) for online, target in zip(online_variables, target_variables)
+        ]
 
         # loss function
         self.y_ = tf.placeholder(tf.float32, [None, self.n_actions])
@@ -57,14 +112,36 @@ class DQNAgent:
 
         # train operation
         optimizer = tf.train.RMSPropOptimizer(self.learning_rate)
-        self.training = optimizer.minimize(self.loss)
+        self.training = optimizer.minimize(self.loss, var_list=online_variables)
 
-        # saver
-        self.saver = tf.train.Saver()
+        # all variables of this agent (networks and optimizer slots)
+        self.variables = tf.global_variables()
+        self.init_op = tf.global_variables_initializer()
 
-        # session
-        self.sess = tf.Session()
-        self.sess.run(tf.global_variables_initializer())
+        # saver (without target network, it is synced after loading)
+        target_names = set(variable.name for variable in target_variables)
+        self.saver = tf.train.Saver([
+            variable for variable in self.variables if variable.name not in target_names
+        ])
+
+    def build_network(self, x_flat, xy, trainable=True):
+        # fully connected layer (32) ??
+        W_fc1 = tf.Variable(tf.truncated_normal([xy, xy], stddev=0.01), trainable=trainable)
+        b_fc1 = tf.Variable(tf.zeros([xy]), trainable=trainable)
+        h_fc1 = tf.nn.relu(tf.matmul(x_flat, W_fc1) + b_fc1)
+
+        # output layer (n_actions)
+        W_out = tf.Variable(tf.truncated_normal([xy, self.n_actions], stddev=0.01), trainable=trainable)
+        b_out = tf.Variable(tf.zeros([self.n_actions]), trainable=trainable)
+        y = tf.matmul(h_fc1, W_out) + b_out
+
+        return y, [W_fc1, b_fc1, W_out, b_out]
+
+    def sync_target(self):
+        self.sess.run(self.sync_target_op)
+
+        # cached next state values belong to the old target network
+        self.next_value_valid[:] = False
 
     def Q_values(self, state):
         # Q(state, action) of all actions
@@ -80,29 +157,55 @@ class DQNAgent:
 
     def store_experience(self, state, action, reward, state_1, terminal):
         self.D.append((state, action, reward, state_1, terminal))
+        self.n_experiences += 1
 
-    def experience_replay(self):
-        state_minibatch = []
-        y_minibatch = []
+    def next_state_values(self, state_minibatch_1, terminals, indexes, mirrored=None):
+        # max_action' Q_target(state', action'), cached per replay slot
+        if isinstance(self.D, DedupReplayBuffer):
+            ids = 2 * self.D.transition_ids(indexes) + mirrored
+        else:
+            ids = self.n_experiences - len(self.D) + indexes
+        slots = ids % len(self.next_values)
+
+        cached = self.next_value_valid[slots] & (self.next_value_ids[slots] == ids)
+        missing = ~cached & ~terminals
+        if np.any(missing):
+            self.next_values[slots[missing]] = np.max(
+                self.sess.run(self.y_target, feed_dict={self.x: state_minibatch_1[missing]}), axis=1
+            )
+            self.next_value_ids[slots[missing]] = ids[missing]
+            self.next_value_valid[slots[missing]] = True
 
+        return np.where(terminals, 0.0, self.next_values[slots])
+
+    def experience_replay(self):
         # sample random minibatch
         minibatch_size = min(len(self.D), self.minibatch_size)
-        minibatch_indexes = np.random.randint(0, len(self.D), minibatch_size)
-
-        for j in minibatch_indexes:
-            state_j, action_j, reward_j, state_j_1, terminal = self.D[j]
-            action_j_index = self.enable_actions.index(action_j)
+        mirrored = None
+        if isinstance(self.D, DedupReplayBuffer):
+            # proportional to visit counts, half of them mirrored back, so the
+            # network learns both orientations of the stored canonical ones
+            minibatch_indexes = self.D.sample_indexes(minibatch_size)
+            mirrored = np.random.rand(minibatch_size) < 0.5
+            minibatch = self.D.gather(minibatch_indexes, mirrored)
+        elif isinstance(self.D, MemmapReplayBuffer):
+            # one sorted read per field
+            minibatch_indexes = self.D.sample_indexes(minibatch_size)
+            minibatch = self.D.gather(minibatch_indexes)
+        else:
+            minibatch_indexes = np.random.randint(0, len(self.D), minibatch_size)
+            minibatch = [np.array(field) for field in zip(*(self.D[j] for j in minibatch_indexes))]
 
-            y_j = self.Q_values(state_j)
+        state_minibatch, actions, rewards, state_minibatch_1, terminals = minibatch
+        terminals = terminals.astype(bool)
+        action_indexes = [self.enable_actions.index(action_j) for action_j in actions]
 
-            if terminal:
-                y_j[action_j_index] = reward_j
-            else:
-                # reward_j + gamma * max_action' Q(state', action')
-                y_j[action_j_index] = reward_j + self.discount_factor * np.max(self.Q_values(state_j_1))  # NOQA
+        # Q(state, action) of all actions, only the taken action is trained
+        y_minibatch = self.sess.run(self.y, feed_dict={self.x: state_minibatch})
 
-            state_minibatch.append(state_j)
-            y_minibatch.append(y_j)
+        # reward_j (terminal) or reward_j + gamma * max_action' Q_target(state', action')
+        y_minibatch[np.arange(minibatch_size), action_indexes] = rewards + self.discount_factor * \
+            self.next_state_values(state_minibatch_1, terminals, minibatch_indexes, mirrored)
 
         # training
         self.sess.run(self.training, feed_dict={self.x: state_minibatch, self.y_: y_minibatch})
@@ -110,15 +213,166 @@ class DQNAgent:
         # for log
         self.current_loss = self.sess.run(self.loss, feed_dict={self.x: state_minibatch, self.y_: y_minibatch})
 
+        self.n_updates += 1
+        if self.n_updates % self.target_update_every == 0:
+            self.sync_target()
+        self.maybe_checkpoint()
+
     def load_model(self, model_path=None):
-        if model_path:
+        if model_path and model_path.endswith(".npz"):
+            # load from background checkpoint (resumes training)
+            self.restore_checkpoint(model_path)
+        elif model_path:
             # load from model_path
             self.saver.restore(self.sess, model_path)
+            self.sync_target()
         else:
             # load from checkpoint
             checkpoint = tf.train.get_checkpoint_state(self.model_dir)
             if checkpoint and checkpoint.model_checkpoint_path:
                 self.saver.restore(self.sess, checkpoint.model_checkpoint_path)
+                self.sync_target()
 
     def save_model(self):
         self.saver.save(self.sess, os.path.join(self.model_dir, self.model_name))
+
+    def maybe_checkpoint(self):
+        due_updates = self.checkpoint_every_updates and \
+            self.n_updates - self.last_checkpoint_update >= self.checkpoint_every_updates
+        due_seconds = self.checkpoint_every_seconds and \
+            time.time() - self.last_checkpoint_time >= self.checkpoint_every_seconds
+        if due_updates or due_seconds:
+            self.checkpoint()
+
+    def snapshot(self):
+        # copy everything needed to resume into memory (numpy arrays)
+        arrays = {
+            "var/" + variable.name: value
+            for variable, value in zip(self.variables, self.sess.run(self.variables))
+        }
+        arrays["n_updates"] = np.array(self.n_updates)
+        arrays["n_experiences"] = np.array(self.n_experiences)
+        if self.scheduler is not None:
+            arrays["scheduler"] = np.array(self.scheduler.state())
+
+        _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+        arrays["rng_keys"] = keys
+        arrays["rng_state"] = np.array([pos, has_gauss, cached_gaussian])
+
+        if isinstance(self.D, MemmapReplayBuffer):
+            # the buffer is on disk already, only persist its counters
+            self.D.flush()
+            arrays["replay_position"] = np.array(self.D.position)
+            arrays["replay_size"] = np.array(self.D.size)
+            arrays["replay_total"] = np.array(self.D.total)
+        elif self.checkpoint_replay and len(self.D) > 0:
+            states, actions, rewards, states_1, terminals = zip(*self.D)
+            arrays["replay_states"] = np.array(states)
+            arrays["replay_actions"] = np.array(actions)
+            arrays["replay_rewards"] = np.array(rewards)
+            arrays["replay_states_1"] = np.array(states_1)
+            arrays["replay_terminals"] = np.array(terminals)
+            if isinstance(self.D, DedupReplayBuffer):
+                arrays["replay_counts"] = self.D.visit_counts()
+        return arrays
+
+    def checkpoint(self):
+        # snapshot now, write in the background
+        if self.checkpoint_thread is None:
+            self.checkpoint_thread = threading.Thread(
+                target=self._checkpoint_writer, daemon=True
+            )
+            self.checkpoint_thread.start()
+
+        path = os.path.join(
+            self.model_dir,
+            "{}-{:010d}.npz".format(self.environment_name, self.n_updates)
+        )
+        self.checkpoint_queue.put((path, self.snapshot()))
+        self.last_checkpoint_update = self.n_updates
+        self.last_checkpoint_time = time.time()
+
+    def _checkpoint_writer(self):
+        while True:
+            path, arrays = self.checkpoint_queue.get()
+            tmp_path = path + ".tmp"
+            try:
+                os.makedirs(self.model_dir, exist_ok=True)
+
+                # write to a temporary file and rename (atomic)
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **arrays)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+
+                # keep only the last checkpoints
+                for old_path in self.checkpoints()[:-self.checkpoint_keep]:
+                    os.remove(old_path)
+            except Exception as e:
+                # e.g. disk full: skip this checkpoint, keep the writer alive
+                # (a dead writer would block the next checkpoint() forever)
+                self.checkpoint_error = e
+                print("Checkpoint {} failed: {!r}".format(path, e))
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            finally:
+                self.checkpoint_queue.task_done()
+
+    def wait_for_checkpoints(self):
+        self.checkpoint_queue.join()
+
+    def checkpoints(self):
+        return sorted(glob.glob(
+            os.path.join(self.model_dir, "{}-*.npz".format(self.environment_name))
+        ))
+
+    def latest_checkpoint(self):
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def restore_checkpoint(self, path):
+        with np.load(path) as arrays:
+            for variable in self.variables:
+                variable.load(arrays["var/" + variable.name], self.sess)
+
+            # target network is part of the variables, only the cache is stale
+            self.next_value_valid[:] = False
+
+            self.n_updates = int(arrays["n_updates"])
+            self.n_experiences = int(arrays["n_experiences"])
+            if "scheduler" in arrays and self.scheduler is not None:
+                self.scheduler.load_state(arrays["scheduler"])
+            self.last_checkpoint_update = self.n_updates
+            self.last_checkpoint_time = time.time()
+
+            pos, has_gauss, cached_gaussian = arrays["rng_state"]
+            np.random.set_state((
+                "MT19937", arrays["rng_keys"], int(pos), int(has_gauss),
+                float(cached_gaussian)
+            ))
+
+            if "replay_position" in arrays and isinstance(self.D, MemmapReplayBuffer):
+                # meta.json may be ahead of (or behind) the checkpoint. Go back
+                # to its position; transitions appended after the checkpoint
+                # may have overwritten its oldest ones, drop those
+                size, total = int(arrays["replay_size"]), int(arrays["replay_total"])
+                overwritten = max(0, self.D.total - total - (self.D.capacity - size))
+                self.D.position = int(arrays["replay_position"])
+                self.D.size = max(0, size - overwritten)
+                self.D.total = total
+                self.D.flush()
+
+            if "replay_states" in arrays:
+                self.D.clear()
+                transitions = zip(
+                    arrays["replay_states"],
+                    arrays["replay_actions"].tolist(),
+                    arrays["replay_rewards"].tolist(),
+                    arrays["replay_states_1"],
+                    arrays["replay_terminals"].tolist(),
+                )
+                if "replay_counts" in arrays and isinstance(self.D, DedupReplayBuffer):
+                    self.D.extend(list(transitions), arrays["replay_counts"].tolist())
+                else:
+                    self.D.extend(transitions)
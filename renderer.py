@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+import sys
+
+import numpy as np
+
+# ANSI escape sequences
+CLEAR_SCREEN = '\x1b[2J'
+CLEAR_BELOW = '\x1b[J'
+HOME = '\x1b[H'
+
+
+def move_cursor(line, column):
+    # Terminal lines and columns start at 1
+    return f'\x1b[{line};{column}H'
+
+
+class TerminalRenderer():
+    """
+    Draws a board in place using ANSI cursor movement.
+
+    The first frame clears the screen and draws the whole board, every
+    following frame only rewrites the cells that changed since the last
+    frame. Everything is collected into one buffer and written at once,
+    so no subprocess (like `clear`) is needed.
+
+    Layout (terminal lines):
+        1 .. m      board rows, framed by '|'
+        m + 1       column indices
+        m + 2 ..    status message and input prompts
+    """
+
+    def __init__(self, m, visualisation, stream=None):
+        self.m = m
+        self.visualisation = visualisation
+        self.stream = stream if stream is not None else sys.stdout
+
+        self.reset()
+
+    def reset(self):
+        # Forget the drawn frame, the next draw redraws the whole screen
+        self.drawn = None
+
+    def _full_frame(self, board):
+        buffer = [CLEAR_SCREEN, HOME]
+        for row in board:
+            buffer.append(
+                '|' + ''.join([self.visualisation[val] for val in row]) + '|\n'
+            )
+        # Make it more human readable
+        buffer.append(f' {"".join([str(i) for i in range(self.m)])} \n')
+        return buffer
+
+    def _changed_cells(self, board):
+        buffer = []
+        for row, col in np.argwhere(board != self.drawn):
+            buffer.append(move_cursor(row + 1, col + 2))
+            buffer.append(self.visualisation[board[row, col]])
+        return buffer
+
+    def draw(self, board, message=None):
+        if self.drawn is None:
+            buffer = self._full_frame(board)
+        else:
+            buffer = self._changed_cells(board)
+
+        # Remove old messages and prompts below the board
+        buffer.append(move_cursor(self.m + 2, 1) + CLEAR_BELOW)
+        if message:
+            buffer.append(message + '\n')
+
+        self.drawn = np.array(board, copy=True)
+
+        self.stream.write(''.join(buffer))
+        self.stream.flush()
@@ -0,0 +1,284 @@
+import itertools as it
+import json
+import os
+
+import numpy as np
+
+
+class MemmapReplayBuffer:
+    """
+    Replay memory in memory-mapped files on local disk
+
+    Transitions (state, action, reward, state_1, terminal) are stored in
+    one .npy file per field, used as ring buffer of `capacity` entries.
+    Only the counters are kept in RAM (and in meta.json), so the buffer
+    can be much larger than RAM and be reopened to resume training.
+
+    Behaves like the deque used by DQNAgent (append, extend, clear, len,
+    indexing).
+    """
+
+    FIELDS = ["states", "actions", "rewards", "states_1", "terminals"]
+
+    def __init__(self, directory, capacity=None, state_shape=None,
+                 state_dtype=np.int8, flush_every=10000):
+        self.directory = directory
+        self.flush_every = flush_every
+        self.meta_path = os.path.join(directory, "meta.json")
+
+        if os.path.exists(self.meta_path):
+            # reopen existing buffer
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.capacity = meta["capacity"]
+            self.size = meta["size"]
+            self.position = meta["position"]
+            self.total = meta.get("total", self.size)
+            mode = "r+"
+        else:
+            assert capacity is not None and state_shape is not None
+            os.makedirs(directory, exist_ok=True)
+            self.capacity = capacity
+            self.size = 0
+            self.position = 0
+            self.total = 0
+            mode = "w+"
+
+        shapes = {
+            "states": (np.dtype(state_dtype), tuple(state_shape or ())),
+            "actions": (np.dtype(np.int32), ()),
+            "rewards": (np.dtype(np.float32), ()),
+            "states_1": (np.dtype(state_dtype), tuple(state_shape or ())),
+            "terminals": (np.dtype(bool), ()),
+        }
+        self.arrays = {}
+        for field in self.FIELDS:
+            path = os.path.join(directory, field + ".npy")
+            if mode == "r+":
+                self.arrays[field] = np.load(path, mmap_mode="r+")
+            else:
+                dtype, shape = shapes[field]
+                self.arrays[field] = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=dtype, shape=(self.capacity,) + shape
+                )
+        self.n_appended = 0
+
+        if mode == "w+":
+            self.flush()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("replay buffer index out of range")
+        index = self._physical(index)
+        return tuple(
+            self.arrays[field][index].item() if self.arrays[field].ndim == 1
+            else np.asarray(self.arrays[field][index])
+            for field in self.FIELDS
+        )
+
+    def _physical(self, index):
+        # logical index 0 is the oldest transition
+        start = self.position - self.size
+        return (start + index) % self.capacity
+
+    def append(self, transition):
+        for field, value in zip(self.FIELDS, transition):
+            self.arrays[field][self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+        self.n_appended += 1
+        if self.n_appended % self.flush_every == 0:
+            self.flush()
+
+    def extend(self, transitions):
+        for transition in transitions:
+            self.append(transition)
+
+    def clear(self):
+        self.size = 0
+        self.position = 0
+        self.flush()
+
+    def sample_indexes(self, batch_size, run_length=1):
+        """
+        Random logical indexes, ordered by their position on disk. With
+        run_length > 1 they form contiguous runs, so reads are sequential.
+        """
+        n_runs = max(1, -(-batch_size // run_length))
+        starts = np.random.randint(0, self.size, n_runs)
+        indexes = (starts[:, np.newaxis] + np.arange(run_length)).reshape(-1)
+        indexes = indexes[:batch_size] % self.size
+        return indexes[np.argsort(self._physical(indexes))]
+
+    def gather(self, indexes):
+        """
+        Returns the transitions at the logical indexes as arrays (states,
+        actions, rewards, states_1, terminals).
+        """
+        physical = self._physical(np.asarray(indexes))
+        return tuple(
+            np.asarray(self.arrays[field][physical]) for field in self.FIELDS
+        )
+
+    def sample(self, batch_size, run_length=1):
+        return self.gather(self.sample_indexes(batch_size, run_length))
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+
+        # write counters atomically
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "capacity": self.capacity,
+                "size": self.size,
+                "position": self.position,
+                "total": self.total,
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+
+
+class DedupReplayBuffer:
+    """
+    Replay memory storing every unique transition once, with a visit count
+
+    Transitions equal up to a left-right mirror of the board (and the
+    mirrored action) share one entry; the canonical (smaller) form is
+    stored. Sampling is proportional to the visit counts, so training
+    sees the same distribution as with duplicates while `capacity`
+    unique transitions fit into memory. When full, the oldest unique
+    transition is replaced. Sampled transitions are mirrored back with
+    probability 0.5, so both orientations are replayed.
+
+    Behaves like the deque used by DQNAgent (append, extend, clear, len,
+    indexing oldest first).
+    """
+
+    def __init__(self, capacity, n_actions):
+        self.capacity = capacity
+        self.n_actions = n_actions
+
+        self.transitions = [None] * capacity
+        self.keys = [None] * capacity
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.index = {}  # key -> slot
+
+        self.size = 0
+        self.position = 0
+        self.n_unique = 0
+        self.n_appended = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("replay buffer index out of range")
+        return self.transitions[self._physical(index)]
+
+    def _physical(self, index):
+        # logical index 0 is the oldest unique transition
+        start = self.position - self.size
+        return (start + index) % self.capacity
+
+    def _key(self, state, action, reward, state_1, terminal):
+        return (
+            np.asarray(state, dtype=np.int8).tobytes(), int(action), float(reward),
+            np.asarray(state_1, dtype=np.int8).tobytes(), bool(terminal)
+        )
+
+    def mirror(self, transition):
+        state, action, reward, state_1, terminal = transition
+        return (
+            np.fliplr(state).copy(), self.n_actions - 1 - action, reward,
+            np.fliplr(state_1).copy(), terminal
+        )
+
+    def canonical(self, transition):
+        state, action, reward, state_1, terminal = transition
+        transition = (np.array(state), action, reward, np.array(state_1), terminal)
+        mirrored = self.mirror(transition)
+        key, mirrored_key = self._key(*transition), self._key(*mirrored)
+        if mirrored_key < key:
+            return mirrored_key, mirrored
+        return key, transition
+
+    def append(self, transition, count=1):
+        key, transition = self.canonical(transition)
+        self.n_appended += count
+
+        slot = self.index.get(key)
+        if slot is not None:
+            self.counts[slot] += count
+            return
+
+        # new unique transition, replace the oldest one when full
+        slot = self.position
+        if self.keys[slot] is not None:
+            del self.index[self.keys[slot]]
+        self.transitions[slot] = transition
+        self.keys[slot] = key
+        self.counts[slot] = count
+        self.ids[slot] = self.n_unique
+        self.index[key] = slot
+
+        self.n_unique += 1
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, transitions, counts=None):
+        if counts is None:
+            counts = it.repeat(1)
+        for transition, count in zip(transitions, counts):
+            self.append(transition, count)
+
+    def clear(self):
+        self.__init__(self.capacity, self.n_actions)
+
+    def dedup_ratio(self):
+        # fraction of appended transitions that were already stored
+        return 1.0 - self.n_unique / max(self.n_appended, 1)
+
+    def visit_counts(self):
+        # oldest first, like indexing
+        return self.counts[self._physical(np.arange(self.size))]
+
+    def transition_ids(self, indexes):
+        # stable while the transition is stored
+        return self.ids[self._physical(np.asarray(indexes))]
+
+    def sample_indexes(self, batch_size):
+        # logical indexes, proportional to the visit counts
+        cumulative = np.cumsum(self.visit_counts())
+        return np.searchsorted(
+            cumulative, np.random.randint(0, cumulative[-1], batch_size), side="right"
+        )
+
+    def gather(self, indexes, mirrored=None):
+        """
+        Returns the transitions at the logical indexes as arrays (states,
+        actions, rewards, states_1, terminals), the ones with `mirrored`
+        set flipped left-right (with the mirrored action).
+        """
+        transitions = [self[j] for j in indexes]
+        if mirrored is not None:
+            transitions = [
+                self.mirror(transition) if flip else transition
+                for transition, flip in zip(transitions, mirrored)
+            ]
+        return tuple(np.array(field) for field in zip(*transitions))
+
+    def sample(self, batch_size):
+        indexes = self.sample_indexes(batch_size)
+        return self.gather(indexes, np.random.rand(len(indexes)) < 0.5)
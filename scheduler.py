@@ -0,0 +1,45 @@
+class UpdateScheduler:
+    """
+    Decides how many gradient steps to run after each environment step
+
+    - no updates during the first `warmup_steps` frames
+    - then every `train_every` frames `gradient_steps` updates, or
+    - with `replay_ratio` set, as many updates as needed to replay
+      `replay_ratio` samples (minibatch_size per update) per collected one
+    """
+
+    def __init__(self, warmup_steps=0, train_every=1, gradient_steps=1,
+                 replay_ratio=None, minibatch_size=32):
+        self.warmup_steps = warmup_steps
+        self.train_every = train_every
+        self.gradient_steps = gradient_steps
+        self.replay_ratio = replay_ratio
+        self.minibatch_size = minibatch_size
+
+        self.frames = 0
+        self.replayed = 0
+        self.updates = 0
+
+    def step(self):
+        self.frames += 1
+        collected = self.frames - self.warmup_steps
+        if collected <= 0 or collected % self.train_every != 0:
+            return 0
+
+        if self.replay_ratio is None:
+            n_steps = self.gradient_steps
+        else:
+            # catch up with the target number of replayed samples
+            target = self.replay_ratio * collected
+            n_steps = max(0, int((target - self.replayed) // self.minibatch_size))
+
+        self.replayed += n_steps * self.minibatch_size
+        self.updates += n_steps
+        return n_steps
+
+    def state(self):
+        # counters, saved in checkpoints to resume the schedule
+        return [self.frames, self.replayed, self.updates]
+
+    def load_state(self, state):
+        self.frames, self.replayed, self.updates = (int(value) for value in state)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+from multiprocessing import shared_memory
+import threading
+import time
+
+import numpy as np
+
+from heuristic import ThreatEvaluator
+
+# Larger than any heuristic evaluation
+WIN_SCORE = 1e15
+
+# Flags of transposition table entries
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class TranspositionTable():
+    """
+    Search results per position, keyed by a 64-bit (Zobrist) hash.
+    Entries are (depth, value, flag, move).
+
+    Holds at most `size` entries, one per slot (the low bits of the key),
+    so memory stays bounded over long runs. A position replaces another
+    one in its slot; results of the same position are kept if deeper.
+    """
+
+    def __init__(self, size=2 ** 20):
+        # Power of two, so the slot is key & mask
+        assert size & (size - 1) == 0, 'Size must be a power of two.'
+        self.size = size
+        self.mask = size - 1
+        self.entries = {}  # slot -> (key, depth, value, flag, move)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries.get(key & self.mask)
+        if entry is None or entry[0] != key:
+            return None
+        self.hits += 1
+        return entry[1:]
+
+    def store(self, key, depth, value, flag, move):
+        entry = self.entries.get(key & self.mask)
+        # Keep deeper results of the same position
+        if entry is None or entry[0] != key or entry[1] <= depth:
+            self.entries[key & self.mask] = (key, depth, value, flag, move)
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / max(self.probes, 1),
+            'entries': len(self.entries),
+        }
+
+
+class SharedTranspositionTable():
+    """
+    Fixed-size, lock-free transposition table in shared memory.
+
+    Every slot holds three uint64 words: (key ^ data ^ value, data, value).
+    data packs depth, flag, move and a valid bit, value holds the bits of
+    the float64 score (full precision, so win scores keep their depth).
+    A torn write of another process makes the check word inconsistent,
+    so it reads as a miss instead of a wrong entry and no locks are
+    needed.
+
+    The table pickles to its shared memory name, so it can be passed to
+    worker processes (e.g. multiprocessing.Pool), which attach to it.
+    Statistics are counted per process.
+    """
+
+    VALID = 1 << 63
+
+    def __init__(self, size=2 ** 20, name=None):
+        # Power of two, so the slot is key & mask
+        assert size & (size - 1) == 0, 'Size must be a power of two.'
+        self.size = size
+        self.mask = size - 1
+        self.owner = name is None
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size * 24)
+        else:
+            # Only the creating process removes the memory (see close)
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.slots = np.ndarray((size, 3), dtype=np.uint64, buffer=self.shm.buf)
+        if self.owner:
+            self.slots[:] = 0
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    def __getstate__(self):
+        return {'size': self.size, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['size'], state['name'])
+
+    @staticmethod
+    def _pack(depth, flag, move):
+        return (
+            (depth & 0xff)
+            | (flag & 0xff) << 8
+            | ((-1 if move is None else move) & 0xff) << 16
+            | SharedTranspositionTable.VALID
+        )
+
+    @staticmethod
+    def _unpack(data, value):
+        move = (data >> 16) & 0xff
+        return (
+            data & 0xff,
+            float(np.array(value, dtype=np.uint64).view(np.float64)),
+            (data >> 8) & 0xff,
+            None if move == 0xff else move,
+        )
+
+    def _read(self, key):
+        # (data, value) of the slot, if it holds this key
+        check, data, value = (int(word) for word in self.slots[key & self.mask])
+        if not data & self.VALID:
+            return None
+        if check ^ data ^ value != key:
+            # Other position (or torn write) in this slot
+            self.collisions += 1
+            return None
+        return data, value
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self._read(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        return self._unpack(*entry)
+
+    def store(self, key, depth, value, flag, move):
+        self.stores += 1
+        slot = self.slots[key & self.mask]
+        if int(slot[1]) & self.VALID:
+            entry = self._read(key)
+            # Keep deeper results of the same position
+            if entry is not None and entry[0] & 0xff > depth:
+                return
+
+        data = self._pack(depth, flag, move)
+        value = int(np.array(value, dtype=np.float64).view(np.uint64))
+        slot[1] = data
+        slot[2] = value
+        slot[0] = key ^ data ^ value
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / max(self.probes, 1),
+            'stores': self.stores,
+            'collisions': self.collisions,
+            'occupancy': float(np.mean(
+                (self.slots[:, 1] & np.uint64(self.VALID)) != 0
+            )),
+        }
+
+    def close(self):
+        del self.slots
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SearchPlayer():
+    """
+    Alpha-beta (negamax) search with iterative deepening and a
+    transposition table, using the ThreatEvaluator at the leaves.
+
+    Searches until `max_depth` or `time_limit` seconds. With pondering,
+    the player searches the likely replies of the opponent while waiting
+    for its move; the results stay in the transposition table, so the
+    following search starts from them.
+    """
+
+    def __init__(self, winning_templates, n, max_depth=6, time_limit=1.,
+                 table=None, weights=None, seed=0):
+        self.evaluator = ThreatEvaluator(winning_templates, n, weights)
+        self.n = n  # Required disks to win
+        self.m = self.evaluator.m  # Size of field
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.table = table if table is not None else TranspositionTable()
+
+        # Lines through each cell, to check wins of the last disk only
+        lines = np.array([np.flatnonzero(t) for t in winning_templates])
+        self.cell_lines = [
+            lines[np.any(lines == cell, axis=1)] for cell in range(self.m ** 2)
+        ]
+
+        # Same seed --> same hashes in every process
+        self.zobrist = np.random.RandomState(seed).randint(
+            0, 2 ** 63, size=(self.m * self.m, 2), dtype=np.int64
+        ).astype(np.uint64)
+
+        # Try central columns first
+        center = (self.m - 1) / 2
+        self.column_order = sorted(range(self.m), key=lambda c: abs(c - center))
+
+        self.deadline = np.inf
+        self.stop = threading.Event()
+        self.ponder_thread = None
+        self.nodes = 0
+
+    def hash(self, board):
+        cells = np.flatnonzero(board)
+        colours = (board.reshape(-1)[cells] == -1).astype(int)
+        return int(np.bitwise_xor.reduce(
+            self.zobrist[cells, colours], initial=np.uint64(0)
+        ))
+
+    def _zobrist(self, row, column, disk):
+        return int(self.zobrist[row * self.m + column, 0 if disk == 1 else 1])
+
+    def _wins(self, board, row, column, disk):
+        flat = board.reshape(-1)
+        return np.any(
+            np.sum(flat[self.cell_lines[row * self.m + column]], axis=1)
+            == self.n * disk
+        )
+
+    def _negamax(self, board, heights, disk, depth, alpha, beta, key):
+        if self.stop.is_set() or time.time() > self.deadline:
+            raise SearchAborted()
+        self.nodes += 1
+
+        if depth == 0:
+            return self.evaluator.evaluate(board[np.newaxis], disk)[0], None
+
+        alpha_original = alpha
+        entry = self.table.probe(key)
+        if entry is not None and entry[0] >= depth:
+            _, value, flag, move = entry
+            if flag == EXACT:
+                return value, move
+            elif flag == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value, move
+
+        moves = [c for c in self.column_order if heights[c] < self.m]
+        if not moves:
+            # Board is full --> no winner
+            return 0., None
+        if entry is not None and entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+
+        best_value, best_move = -np.inf, moves[0]
+        for column in moves:
+            row = self.m - heights[column] - 1
+            board[row, column] = disk
+            heights[column] += 1
+            try:
+                if self._wins(board, row, column, disk):
+                    # Prefer fast wins
+                    value = WIN_SCORE + depth
+                else:
+                    value = -self._negamax(
+                        board, heights, -disk, depth - 1, -beta, -alpha,
+                        key ^ self._zobrist(row, column, disk)
+                    )[0]
+            finally:
+                board[row, column] = 0
+                heights[column] -= 1
+
+            if value > best_value:
+                best_value, best_move = value, column
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= alpha_original:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(key, depth, best_value, flag, best_move)
+        return best_value, best_move
+
+    def search(self, board, disk, depth):
+        """
+        Returns (value, column) of a search of the given depth.
+        """
+        board = np.array(board, copy=True)
+        heights = list(np.sum(board != 0, axis=0))
+        return self._negamax(
+            board, heights, disk, depth, -np.inf, np.inf, self.hash(board)
+        )
+
+    def select_action(self, board, disk):
+        self.stop_pondering()
+        self.deadline = time.time() + self.time_limit
+
+        best = None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                value, best = self.search(board, disk, depth)
+                if abs(value) >= WIN_SCORE:
+                    break
+        except SearchAborted:
+            pass
+        finally:
+            self.deadline = np.inf
+
+        if best is None:
+            # Not even depth 1 finished: greedy choice
+            columns, scores = self.evaluator.score_columns(board, disk)
+            best = columns[np.argmax(scores)]
+        return int(best)
+
+    def __call__(self, board, disk):
+        return self.select_action(board, disk)
+
+    def _ponder(self, board, disk):
+        # Likely replies of the opponent first
+        columns, scores = self.evaluator.score_columns(board, disk)
+        replies = columns[np.argsort(-scores)]
+        heights = np.sum(board != 0, axis=0)
+        try:
+            for depth in range(1, self.max_depth + 1):
+                for column in replies:
+                    child = np.array(board, copy=True)
+                    row = self.m - heights[column] - 1
+                    child[row, column] = disk
+                    if self._wins(child, row, column, disk):
+                        continue
+                    self.search(child, -disk, depth)
+        except SearchAborted:
+            pass
+
+    def start_pondering(self, board, disk):
+        """
+        Searches in the background while `disk` (the opponent) thinks.
+        """
+        self.stop_pondering()
+        self.ponder_thread = threading.Thread(
+            target=self._ponder, args=(np.array(board, copy=True), disk),
+            daemon=True
+        )
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        if self.ponder_thread is not None:
+            self.stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+        self.stop.clear()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+
+# Game values from the point of view of the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+UNKNOWN = -2
+
+
+def winning_lines(n, m):
+    # Same lines as create_winning_templates, as flat cell indices (K, n)
+    lines = []
+    for row in range(m):
+        for col in range(m):
+
+            # Horizontal lines
+            if col + n <= m:
+                lines.append([row * m + col + i for i in range(n)])
+
+            # Vertical lines
+            if row + n <= m:
+                lines.append([(row + i) * m + col for i in range(n)])
+
+            # Diagonal lines (down and up)
+            if (col + n <= m) & (row + n <= m):
+                lines.append([(row + i) * m + col + i for i in range(n)])
+                lines.append([(row + i) * m + m - 1 - col - i for i in range(n)])
+
+    return np.array(lines, dtype=np.intp)
+
+
+def winning_templates(n, m):
+    # winning_lines as boards (K, m, m), like create_winning_templates
+    lines = winning_lines(n, m)
+    templates = np.zeros((len(lines), m * m))
+    templates[np.arange(len(lines))[:, np.newaxis], lines] = 1
+    return templates.reshape(-1, m, m)
+
+
+class RetrogradeSolver():
+    """
+    Solves a ConnectN game completely.
+
+    All reachable positions are enumerated layer by layer (layer d holds
+    the positions with d disks) and then solved backwards, from the full
+    board to the empty one. Every position gets a value (WIN, DRAW, LOSS
+    for the player to move) and the number of disks left to play under
+    perfect play (the winner plays fast, the loser slow).
+
+    Positions are encoded into uint64 keys, m + 1 bits per column: a
+    marker bit at the column height and one colour bit per disk below it
+    (1 for X, 0 for O). Each layer is stored as sorted key array with
+    aligned value and distance arrays, so lookups are a binary search.
+
+    If `table_dir` is given, every layer is written to disk and read back
+    memory-mapped, and the children of a layer are deduplicated in key
+    range buckets on disk, so configurations larger than RAM can be
+    solved. Without `table_dir` everything stays in memory.
+    """
+
+    def __init__(self, n, m, winning_templates=None, table_dir=None,
+                 chunk_size=1000000, n_buckets=16):
+        # Column fields have to fit into one uint64 key
+        assert m * (m + 1) <= 64, 'Board too large for uint64 keys.'
+        assert m * m <= 255, 'Board too large for uint8 distances.'
+
+        self.n = n  # Required disks to win
+        self.m = m  # Size of field
+        self.table_dir = table_dir
+        self.chunk_size = chunk_size
+        self.n_buckets = n_buckets if table_dir else 1
+
+        if winning_templates is None:
+            self.lines = winning_lines(n, m)
+        else:
+            self.lines = np.array([
+                np.flatnonzero(template) for template in winning_templates
+            ], dtype=np.intp)
+
+        self.field_bits = m + 1
+        self.field_mask = np.uint64((1 << self.field_bits) - 1)
+        self.layers = {}
+
+        if table_dir:
+            os.makedirs(table_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, env, **kwargs):
+        # Use the rules of a game instance (e.g. ConnectNEnv)
+        return cls(env.n, env.m, env.winning_templates, **kwargs)
+
+    # Storage
+
+    def _path(self, name):
+        return os.path.join(self.table_dir, f'{name}.npy')
+
+    def _save(self, name, array):
+        if self.table_dir is None:
+            self.layers[name] = array
+            return array
+        np.save(self._path(name), array)
+        return self._load(name)
+
+    def _load(self, name):
+        if self.table_dir is None:
+            return self.layers[name]
+        return np.load(self._path(name), mmap_mode='r')
+
+    def _create(self, name, length, dtype):
+        # New (uninitialized) array, memory-mapped with table_dir
+        if self.table_dir is None:
+            self.layers[name] = np.empty(length, dtype=dtype)
+            return self.layers[name]
+        return np.lib.format.open_memmap(
+            self._path(name), mode='w+', dtype=dtype, shape=(length,)
+        )
+
+    def _chunks(self, array):
+        for start in range(0, len(array), self.chunk_size):
+            yield np.asarray(array[start:start + self.chunk_size])
+
+    # Encoding
+
+    def encode(self, board):
+        key = 0
+        for col in range(self.m):
+            column = board[::-1, col]
+            height = int(np.sum(column != 0))
+            field = 1 << height
+            for level in range(height):
+                if column[level] == 1:
+                    field |= 1 << level
+            key |= field << (col * self.field_bits)
+        return np.uint64(key)
+
+    def decode(self, keys):
+        """
+        Returns boards (N, m * m) and column heights (N, m) of the keys.
+        """
+        boards = np.zeros((len(keys), self.m, self.m), dtype=np.int8)
+        heights = np.zeros((len(keys), self.m), dtype=np.int64)
+        for col in range(self.m):
+            field = (keys >> np.uint64(col * self.field_bits)) & self.field_mask
+            for level in range(1, self.m + 1):
+                heights[:, col] += field >= np.uint64(1 << level)
+            for level in range(self.m):
+                colour = (field >> np.uint64(level)) & np.uint64(1)
+                boards[:, self.m - 1 - level, col] = np.where(
+                    heights[:, col] > level, np.where(colour == 1, 1, -1), 0
+                )
+        return boards.reshape(len(keys), -1), heights
+
+    def is_won(self, boards):
+        sums = np.sum(boards[:, self.lines], axis=2, dtype=np.int64)
+        return np.any(np.abs(sums) == self.n, axis=1)
+
+    def children(self, keys, heights, disks, col):
+        # X moves on an even number of disks: colour bit 1
+        x = 1 if disks % 2 == 0 else 0
+        shift = (col * self.field_bits + heights[:, col]).astype(np.uint64)
+        return keys + np.left_shift(np.uint64(1 + x), shift)
+
+    # Forward pass
+
+    def _layer_children(self, keys, disks):
+        # Sorted unique children of the non terminal positions in keys
+        boards, heights = self.decode(keys)
+        open_ = ~self.is_won(boards)
+
+        children = []
+        for col in range(self.m):
+            playable = open_ & (heights[:, col] < self.m)
+            children.append(self.children(
+                keys[playable], heights[playable], disks, col
+            ))
+        return np.unique(np.concatenate(children))
+
+    def _splitters(self, keys, disks, sample_size=100000):
+        # Bucket boundaries at the quantiles of the children of a sample,
+        # so the buckets get about the same number of keys
+        sample = np.asarray(keys[np.unique(np.linspace(
+            0, len(keys) - 1, min(len(keys), sample_size)
+        ).astype(np.int64))])
+        children = self._layer_children(sample, disks)
+        if len(children) == 0:
+            return children
+        quantiles = np.arange(1, self.n_buckets) * len(children) // self.n_buckets
+        return np.unique(children[quantiles])
+
+    def _save_children(self, keys, disks):
+        """
+        Saves the next layer: the sorted unique children of all non
+        terminal positions of a layer.
+
+        With table_dir, the children of every chunk are split into key
+        range buckets on disk, each bucket is merged alone and written
+        into the memory-mapped layer file. Only one chunk or one bucket
+        is in memory at a time.
+        """
+        name = f'keys_{disks + 1:03d}'
+        if self.table_dir is None:
+            return self._save(name, np.unique(np.concatenate([
+                self._layer_children(chunk, disks)
+                for chunk in self._chunks(keys)
+            ] or [np.zeros(0, dtype=np.uint64)])))
+
+        splitters = self._splitters(keys, disks)
+        pieces = [[] for _ in range(len(splitters) + 1)]
+        for i, chunk in enumerate(self._chunks(keys)):
+            children = self._layer_children(chunk, disks)
+            bounds = np.searchsorted(children, splitters)
+            for b, bucket in enumerate(np.split(children, bounds)):
+                if len(bucket):
+                    piece = f'tmp_{disks + 1:03d}_{b:04d}_{i:06d}'
+                    np.save(self._path(piece), bucket)
+                    pieces[b].append(piece)
+
+        # Merge every bucket, count the keys to size the layer file
+        merged, lengths = [], []
+        for b, names in enumerate(pieces):
+            if names:
+                bucket = np.unique(np.concatenate([
+                    np.load(self._path(piece)) for piece in names
+                ]))
+                for piece in names:
+                    os.remove(self._path(piece))
+                merged.append(f'tmp_{disks + 1:03d}_{b:04d}')
+                lengths.append(len(bucket))
+                np.save(self._path(merged[-1]), bucket)
+
+        # Buckets are disjoint key ranges in order: the layer stays sorted
+        layer = self._create(name, sum(lengths), np.uint64)
+        start = 0
+        for bucket, length in zip(merged, lengths):
+            layer[start:start + length] = np.load(self._path(bucket))
+            start += length
+            os.remove(self._path(bucket))
+        layer.flush()
+        return self._load(name)
+
+    def enumerate_positions(self):
+        keys = np.array([sum(
+            1 << (col * self.field_bits) for col in range(self.m)
+        )], dtype=np.uint64)
+        counts = [len(self._save('keys_000', keys))]
+
+        for disks in range(self.m * self.m):
+            keys = self._save_children(keys, disks)
+            counts.append(len(keys))
+        return counts
+
+    # Backward pass
+
+    def _solve_layer(self, disks):
+        keys = self._load(f'keys_{disks:03d}')
+        values = self._create(f'values_{disks:03d}', len(keys), np.int8)
+        distances = self._create(f'distances_{disks:03d}', len(keys), np.uint8)
+
+        if disks < self.m * self.m:
+            next_keys = self._load(f'keys_{disks + 1:03d}')
+            next_values = self._load(f'values_{disks + 1:03d}')
+            next_distances = self._load(f'distances_{disks + 1:03d}')
+
+        start = 0
+        for chunk in self._chunks(keys):
+            boards, heights = self.decode(chunk)
+            won = self.is_won(boards)
+
+            # The player to move lost, or the board is full
+            value = np.full(len(chunk), UNKNOWN, dtype=np.int8)
+            distance = np.zeros(len(chunk), dtype=np.int16)
+            value[won] = LOSS
+            if disks == self.m * self.m:
+                value[~won] = DRAW
+
+            open_ = value == UNKNOWN
+            for col in range(self.m):
+                playable = open_ & (heights[:, col] < self.m)
+                if not np.any(playable):
+                    continue
+                child = self.children(
+                    chunk[playable], heights[playable], disks, col
+                )
+                index = np.searchsorted(next_keys, child)
+
+                # Negamax: the child value is from the opponents view
+                v = -np.asarray(next_values[index], dtype=np.int8)
+                d = np.asarray(next_distances[index], dtype=np.int16) + 1
+                bv, bd = value[playable], distance[playable]
+
+                # Win as fast as possible, lose as slow as possible
+                take = (v > bv) | ((v == bv) & (
+                    ((v == WIN) & (d < bd)) | ((v != WIN) & (d > bd))
+                ))
+                value[playable] = np.where(take, v, bv)
+                distance[playable] = np.where(take, d, bd)
+
+            values[start:start + len(chunk)] = value
+            distances[start:start + len(chunk)] = distance
+            start += len(chunk)
+
+        if self.table_dir is not None:
+            values.flush()
+            distances.flush()
+
+    def solve(self, verbose=True):
+        start = time.time()
+        counts = self.enumerate_positions()
+        if verbose:
+            print(f'Enumerated {sum(counts)} positions '
+                  f'in {time.time() - start:.1f}s')
+
+        for disks in range(self.m * self.m, -1, -1):
+            self._solve_layer(disks)
+
+        elapsed = time.time() - start
+        stats = {
+            'positions': sum(counts),
+            'positions_per_layer': counts,
+            'seconds': elapsed,
+            'positions_per_second': sum(counts) / max(elapsed, 1e-9),
+            # 8 bytes key, 1 byte value, 1 byte distance
+            'table_bytes': sum(counts) * 10,
+            # ru_maxrss is given in kilobytes on Linux
+            'peak_memory_bytes':
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+        if verbose:
+            print(
+                'POSITIONS: {positions} | POS/S: {positions_per_second:.0f} '
+                '| TABLE: {table_mb:.1f}MB | PEAK RSS: {rss_mb:.1f}MB'.format(
+                    table_mb=stats['table_bytes'] / 2**20,
+                    rss_mb=stats['peak_memory_bytes'] / 2**20,
+                    **stats
+                )
+            )
+        return stats
+
+    # Queries
+
+    def lookup(self, board):
+        """
+        Returns value (for the player to move) and distance to the end.
+        """
+        disks = int(np.sum(board != 0))
+        keys = self._load(f'keys_{disks:03d}')
+        key = self.encode(board)
+        index = int(np.searchsorted(keys, key))
+        if index == len(keys) or keys[index] != key:
+            raise ValueError('Position is not reachable.')
+        return (
+            int(self._load(f'values_{disks:03d}')[index]),
+            int(self._load(f'distances_{disks:03d}')[index]),
+        )
+
+    def select_action(self, board, disk=None):
+        # Perfect play; the disk to move follows from the board
+        best = None
+        for col in range(self.m):
+            if board[0, col] != 0:
+                continue
+            child = np.array(board, copy=True)
+            row = self.m - int(np.sum(board[:, col] != 0)) - 1
+            child[row, col] = 1 if np.sum(board != 0) % 2 == 0 else -1
+
+            value, distance = self.lookup(child)
+            value, distance = -value, distance + 1
+            if (
+                best is None or value > best[0] or (value == best[0] and (
+                    (value == WIN and distance < best[1])
+                    or (value != WIN and distance > best[1])
+                ))
+            ):
+                best = (value, distance, col)
+        return best[2]
+
+    def __call__(self, board, disk=None):
+        return self.select_action(board, disk)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Solve Connect N (on m x m) by retrograde analysis.'
+    )
+    parser.add_argument(
+        '-n',
+        help='Required disks to win.',
+        default=3,
+        type=int
+    )
+    parser.add_argument(
+        '-m',
+        help='Dimensions of the board.',
+        default=4,
+        type=int
+    )
+    parser.add_argument(
+        '--table-dir',
+        help='Write the table to this directory (for configs exceeding RAM).',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--chunk-size',
+        help='Positions processed at once.',
+        default=1000000,
+        type=int
+    )
+    args = parser.parse_args()
+
+    solver = RetrogradeSolver(
+        args.n, args.m, table_dir=args.table_dir, chunk_size=args.chunk_size
+    )
+    solver.solve()
+
+    value, distance = solver.lookup(np.zeros((args.m, args.m)))
+    print(f'Empty board: value {value} (X to move), {distance} disks to the end')
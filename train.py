@@ -1,18 +1,110 @@
+import argparse
+
 import numpy as np
 
 from connectn_v2 import ConnectN
 from learner import DQNAgent
+from scheduler import UpdateScheduler
 from collections import deque
 import numpy as np
 
+parser = argparse.ArgumentParser(
+    description="Train a DQNAgent on Connect 3 (4 x 4)."
+)
+parser.add_argument(
+    "--epochs",
+    help="Number of games.",
+    default=1000,
+    type=int
+)
+parser.add_argument(
+    "--warmup-steps",
+    help="Environment steps before learning starts.",
+    default=0,
+    type=int
+)
+parser.add_argument(
+    "--train-every",
+    help="Learn every k environment steps.",
+    default=1,
+    type=int
+)
+parser.add_argument(
+    "--gradient-steps",
+    help="Gradient steps per learning phase.",
+    default=1,
+    type=int
+)
+parser.add_argument(
+    "--replay-ratio",
+    help="Replayed samples per collected sample (overrides --gradient-steps).",
+    default=None,
+    type=float
+)
+parser.add_argument(
+    "--dedup-replay",
+    help="Store unique (mirror invariant) transitions with visit counts.",
+    action="store_true"
+)
+parser.add_argument(
+    "--checkpoint-every-updates",
+    help="Checkpoint every k updates (0: never).",
+    default=1000,
+    type=int
+)
+parser.add_argument(
+    "--checkpoint-every-seconds",
+    help="Checkpoint every t seconds (0: never).",
+    default=0,
+    type=float
+)
+parser.add_argument(
+    "--checkpoint-keep",
+    help="Number of checkpoints to keep.",
+    default=3,
+    type=int
+)
+parser.add_argument(
+    "--resume",
+    help="Resume training from the latest checkpoint.",
+    action="store_true"
+)
+parser.add_argument(
+    "--q-log-every",
+    help="Compute Q values for the log every k environment steps (0: never).",
+    default=1,
+    type=int
+)
+
 
 if __name__ == "__main__":
+    args = parser.parse_args()
+
     # parameters
-    n_epochs = 1000
+    n_epochs = args.epochs
 
     # environment, agent
     env = ConnectN(3, 4, '2c')
-    agent = DQNAgent(env.enable_actions, env.name, env.m, env.m)
+    agent = DQNAgent(
+        env.enable_actions, env.name, env.m, env.m,
+        checkpoint_every_updates=args.checkpoint_every_updates,
+        checkpoint_every_seconds=args.checkpoint_every_seconds,
+        checkpoint_keep=args.checkpoint_keep, checkpoint_replay=True,
+        replay_dedup=args.dedup_replay
+    )
+    scheduler = UpdateScheduler(
+        args.warmup_steps, args.train_every, args.gradient_steps,
+        args.replay_ratio, agent.minibatch_size
+    )
+    agent.scheduler = scheduler
+
+    if args.resume:
+        checkpoint = agent.latest_checkpoint()
+        if checkpoint:
+            print("Resuming from {}".format(checkpoint))
+            agent.load_model(checkpoint)
+        else:
+            print("No checkpoint found, starting from scratch")
 
     # variables
     win = 0
@@ -21,13 +113,16 @@ if __name__ == "__main__":
     for cur_epoch, e in enumerate(range(n_epochs), start=1):
         # reset
         frame = 0
+        updates = 0
+        q_frames = 0
         loss = 0.0
         Q_max = 0.0
         env.reset()
         state_t_1, reward_t, terminal = env.observe()
 
         while not terminal:
-            state_t = state_t_1
+            # the environment updates its board in place
+            state_t = state_t_1.copy()
 
             # execute action in environment
             action_t = agent.select_action(state_t, agent.exploration)
@@ -37,23 +132,32 @@ if __name__ == "__main__":
             state_t_1, reward_t, terminal = env.observe()
 
             # store experience
-            agent.store_experience(state_t, action_t, reward_t, state_t_1, terminal)
+            agent.store_experience(state_t, action_t, reward_t, state_t_1.copy(), terminal)
 
             # experience replay
-            agent.experience_replay()
+            for _ in range(scheduler.step()):
+                agent.experience_replay()
+                loss += agent.current_loss
+                updates += 1
 
             # for log
             frame += 1
-            loss += agent.current_loss
-            Q_max += np.max(agent.Q_values(state_t))
+            if args.q_log_every and frame % args.q_log_every == 0:
+                Q_max += np.max(agent.Q_values(state_t))
+                q_frames += 1
             if reward_t == 1:
                 win += 1
                 n_wins_last_twenty.append(1)
             elif reward_t == -1:
                 n_wins_last_twenty.append(0)
 
-        print("EPOCH: {:03d}/{:03d} | WIN: {:03d} | LOSS: {:.4f} | Q_MAX: {:.4f} | WINFRAC(20): {:.03f}".format(
-            e, n_epochs - 1, win, loss / frame, Q_max / frame, np.mean(n_wins_last_twenty)))
+        log = "EPOCH: {:03d}/{:03d} | WIN: {:03d} | LOSS: {:.4f} | Q_MAX: {:.4f} | WINFRAC(20): {:.03f} | UPDATES: {:d}".format(
+            e, n_epochs - 1, win, loss / max(updates, 1), Q_max / max(q_frames, 1), np.mean(n_wins_last_twenty),
+            scheduler.updates)
+        if args.dedup_replay:
+            log += " | DEDUP: {:.3f}".format(agent.D.dedup_ratio())
+        print(log)
 
     # save model
     agent.save_model()
+    agent.wait_for_checkpoints()